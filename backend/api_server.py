@@ -3,12 +3,13 @@ Flask API server for expense prediction and chatbot.
 Provides endpoints to get predictions based on user's expense history.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, Response
 from flask_cors import CORS
-import pandas as pd
-import pickle
+import joblib
 import numpy as np
-from datetime import datetime
+import re
+from functools import lru_cache
+import orjson
 import logging
 from dotenv import load_dotenv
 
@@ -34,11 +35,10 @@ CORS(app, resources={
 from chatbot_service import chatbot_bp
 app.register_blueprint(chatbot_bp)
 
-# Load the trained model
+# Load the trained model (memory-mapped so Gunicorn --preload workers share the array pages)
 try:
-    with open('expense_predictor_model.pkl', 'rb') as f:
-        model_data = pickle.load(f)
-        logger.info("Model loaded successfully")
+    model_data = joblib.load('expense_predictor_model.joblib', mmap_mode='r')
+    logger.info("Model loaded successfully")
 except FileNotFoundError:
     logger.error("Model file not found. Run train_model.py first!")
     model_data = None
@@ -48,6 +48,52 @@ EXPENSE_CATEGORIES = [
     'Utilities', 'Shopping', 'Healthcare', 'Subscriptions'
 ]
 
+# History months are 'YYYY-MM' strings (a trailing '-DD' day is tolerated)
+MONTH_PATTERN = re.compile(r'\d{4}-(0[1-9]|1[0-2])(-\d{2})?$')
+
+# Order of the per-category blocks in the vector built by _assemble_feature_vector
+FEATURE_KINDS = ['lag1', 'lag2', 'lag3', 'rolling_avg_3']
+
+def _build_feature_layout(feature_columns):
+    """
+    Resolve each model feature column to its position in the source vector
+    [month_num, lag1 x categories, lag2 x ..., lag3 x ..., rolling_avg_3 x ...].
+    """
+    layout = np.empty(len(feature_columns), dtype=np.intp)
+    for i, column in enumerate(feature_columns):
+        if column == 'month_num':
+            layout[i] = 0
+            continue
+        category, kind = column.split('_', 1)
+        layout[i] = 1 + FEATURE_KINDS.index(kind) * len(EXPENSE_CATEGORIES) + EXPENSE_CATEGORIES.index(category)
+    return layout
+
+def _assemble_feature_vector(last3, next_month_num):
+    """Build the (1, n_features) model input from the last 3 months of amounts."""
+    num_categories = len(EXPENSE_CATEGORIES)
+    source = np.empty(1 + len(FEATURE_KINDS) * num_categories, dtype=np.float32)
+    source[0] = next_month_num
+    blocks = source[1:].reshape(len(FEATURE_KINDS), num_categories)
+    blocks[:3] = last3[::-1]  # lag1, lag2, lag3
+    blocks[3] = last3.mean(axis=0)
+    return source[FEATURE_LAYOUT][None, :]
+
+def _to_amount(value):
+    """Coerce a history value to a float, treating missing/invalid values as 0."""
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(amount) else amount
+
+def _build_output_index(categories):
+    """Position of each EXPENSE_CATEGORIES entry in the model's output vector."""
+    return np.array([categories.index(cat) for cat in EXPENSE_CATEGORIES], dtype=np.intp)
+
+# Feature layout and output order are fixed at training time, so resolve them once at startup
+FEATURE_LAYOUT = _build_feature_layout(model_data['feature_columns']) if model_data else None
+OUTPUT_INDEX = _build_output_index(model_data['categories']) if model_data else None
+
 def predict_expenses(user_history):
     """
     Predict next month's expenses given user history.
@@ -71,69 +117,43 @@ def predict_expenses(user_history):
             'message': 'Need at least 3 months of history for accurate predictions'
         }
     
-    # Convert to DataFrame
-    df = pd.DataFrame(user_history)
-    
-    # Fill any NaN values with 0 (safety measure)
-    df = df.fillna(0)
+    # Parse history straight into a (months x categories) float matrix
+    months = [entry['month'] for entry in user_history]
+    amounts = np.zeros((len(user_history), len(EXPENSE_CATEGORIES)), dtype=np.float64)
+    for i, entry in enumerate(user_history):
+        for j, cat in enumerate(EXPENSE_CATEGORIES):
+            amounts[i, j] = _to_amount(entry.get(cat))
     
     # Identify categories the user has actually used (non-zero values in history)
-    user_categories = set()
-    for cat in EXPENSE_CATEGORIES:
-        if cat in df.columns:
-            # Check if user has any non-zero spending in this category
-            # Convert to numeric first to handle any string values
-            df[cat] = pd.to_numeric(df[cat], errors='coerce').fillna(0)
-            if df[cat].sum() > 0:
-                user_categories.add(cat)
+    used_mask = amounts.sum(axis=0) > 0
+    user_categories = [cat for cat, used in zip(EXPENSE_CATEGORIES, used_mask) if used]
     
     logger.info(f"User has used {len(user_categories)} categories: {sorted(user_categories)}")
     
-    # Ensure all categories are present in DataFrame (for feature building)
-    for cat in EXPENSE_CATEGORIES:
-        if cat not in df.columns:
-            df[cat] = 0
-        else:
-            # Ensure numeric and fill NaN
-            df[cat] = pd.to_numeric(df[cat], errors='coerce').fillna(0)
-    
-    # Sort by month
-    df = df.sort_values('month')
+    # Sort by month (histories usually arrive in order, so only sort when needed)
+    last_month_str = months[-1]
+    if any(months[i] > months[i + 1] for i in range(len(months) - 1)):
+        order = np.argsort(months, kind='stable')
+        amounts = amounts[order]
+        last_month_str = months[order[-1]]
     
     # Get last 3 months for lag features
-    last_3_months = df.tail(3)
-    
-    # Build feature vector
-    features = {}
+    last3 = amounts[-3:]
     
-    # Next month number
-    last_month_date = pd.to_datetime(df['month'].iloc[-1])
-    next_month_num = (last_month_date.month % 12) + 1
-    features['month_num'] = next_month_num
+    # Next month number (months are 'YYYY-MM' strings)
+    last_year, last_month = (int(part) for part in last_month_str.split('-')[:2])
+    next_month_num = (last_month % 12) + 1
     
-    # Lag features
-    for category in EXPENSE_CATEGORIES:
-        values = last_3_months[category].values
-        features[f'{category}_lag1'] = float(values[-1]) if len(values) >= 1 else 0
-        features[f'{category}_lag2'] = float(values[-2]) if len(values) >= 2 else 0
-        features[f'{category}_lag3'] = float(values[-3]) if len(values) >= 3 else 0
-        features[f'{category}_rolling_avg_3'] = float(np.mean(values))
+    # Build feature vector in the column order the model was trained on
+    X = _assemble_feature_vector(last3, next_month_num)
     
-    # Create feature DataFrame
-    X = pd.DataFrame([features])[model_data['feature_columns']]
+    # One multi-output predict covers every category; keep ONLY the categories
+    # the user has actually used and set all others to 0
+    raw_preds = model_data['model'].predict(X)[0][OUTPUT_INDEX]
     
-    # Predict ONLY for categories the user has actually used
-    # Set all other categories to 0
-    predictions = {}
-    for category in EXPENSE_CATEGORIES:
-        if category in user_categories:
-            # User has used this category - make prediction
-            X_scaled = model_data['scalers'][category].transform(X)
-            pred = model_data['models'][category].predict(X_scaled)[0]
-            predictions[category] = max(0, round(float(pred), 2))
-        else:
-            # User has never used this category - set to 0
-            predictions[category] = 0
+    # Round in float64 so the JSON output carries clean cent values
+    preds = np.where(used_mask, np.round(raw_preds.astype(np.float64).clip(min=0), 2), 0.0)
+    predictions = dict(zip(EXPENSE_CATEGORIES, preds.tolist()))
     
     total = round(sum(predictions.values()), 2)
     
@@ -141,14 +161,11 @@ def predict_expenses(user_history):
     confidence = 'medium'
     if len(user_history) >= 6:
         # Check variance - lower variance = higher confidence
-        category_variances = []
-        for cat in EXPENSE_CATEGORIES:
-            if cat in df.columns and df[cat].sum() > 0:
-                cv = df[cat].std() / (df[cat].mean() + 1e-6)  # Coefficient of variation
-                category_variances.append(cv)
+        # Coefficient of variation per category (sample std, as pandas computed it)
+        cvs = amounts.std(axis=0, ddof=1) / (amounts.mean(axis=0) + 1e-6)
         
-        if category_variances:
-            avg_cv = np.mean(category_variances)
+        if used_mask.any():
+            avg_cv = float(cvs[used_mask].mean())
             if avg_cv < 0.3:
                 confidence = 'high'
             elif avg_cv > 0.6:
@@ -159,13 +176,34 @@ def predict_expenses(user_history):
         'total': total,
         'confidence': confidence,
         'history_months': len(user_history),
-        'next_month': f"{last_month_date.year}-{next_month_num:02d}"
+        'next_month': f"{last_year}-{next_month_num:02d}"
     }
 
+def _dump_json(obj):
+    """Serialize a response payload with orjson (NumPy scalars become floats)."""
+    return orjson.dumps(obj, default=float, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def _json_response(obj, status=200):
+    """Build a JSON response, replacing Flask's stdlib-json jsonify."""
+    return Response(_dump_json(obj), status=status, mimetype='application/json')
+
+# Log prediction cache stats every N requests
+PREDICTION_CACHE_LOG_INTERVAL = 100
+
+@lru_cache(maxsize=2048)
+def _predict_cached(history_blob):
+    """
+    Run predict_expenses on canonicalized history JSON and return the
+    serialized response, so identical requests skip the model entirely.
+    """
+    result = predict_expenses(orjson.loads(history_blob))
+    logger.info(f"Prediction successful: total=${result['total']}")
+    return _dump_json(result)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return _json_response({
         'status': 'healthy',
         'model_loaded': model_data is not None
     })
@@ -189,37 +227,44 @@ def predict():
     }
     """
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data() or b'{}')
         
         if not data or 'history' not in data:
-            return jsonify({'error': 'Missing history data'}), 400
+            return _json_response({'error': 'Missing history data'}, 400)
         
         history = data['history']
         
         if not isinstance(history, list) or len(history) == 0:
-            return jsonify({'error': 'History must be a non-empty list'}), 400
+            return _json_response({'error': 'History must be a non-empty list'}, 400)
         
         # Validate history format
         for entry in history:
             if 'month' not in entry:
-                return jsonify({'error': 'Each history entry must have a month field'}), 400
+                return _json_response({'error': 'Each history entry must have a month field'}, 400)
+            if not isinstance(entry['month'], str) or not MONTH_PATTERN.match(entry['month']):
+                return _json_response({'error': f"Invalid month {entry['month']!r}, expected 'YYYY-MM'"}, 400)
         
         logger.info(f"Received prediction request with {len(history)} months of history")
         
-        result = predict_expenses(history)
+        # Canonical JSON (sorted keys) so equal histories share a cache entry
+        history_blob = orjson.dumps(history, option=orjson.OPT_SORT_KEYS)
+        response_body = _predict_cached(history_blob)
         
-        logger.info(f"Prediction successful: total=${result['total']}")
+        cache_info = _predict_cached.cache_info()
+        if (cache_info.hits + cache_info.misses) % PREDICTION_CACHE_LOG_INTERVAL == 0:
+            logger.info(f"Prediction cache: {cache_info.hits} hits, {cache_info.misses} misses, "
+                        f"{cache_info.currsize}/{cache_info.maxsize} entries")
         
-        return jsonify(result)
+        return Response(response_body, mimetype='application/json')
     
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
 
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     """Get list of supported expense categories."""
-    return jsonify({
+    return _json_response({
         'categories': EXPENSE_CATEGORIES
     })
 
@@ -235,15 +280,17 @@ def get_recommendations():
     }
     """
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data() or b'{}')
         
         if not data or 'predictions' not in data:
-            return jsonify({'error': 'Missing predictions data'}), 400
+            return _json_response({'error': 'Missing predictions data'}, 400)
         
         predictions = data['predictions']
         current_budget = data.get('current_budget', 2000)
         
-        total_predicted = sum(predictions.values())
+        categories = list(predictions.keys())
+        amounts = np.fromiter(predictions.values(), dtype=np.float64, count=len(predictions))
+        total_predicted = float(amounts.sum())
         
         recommendations = []
         
@@ -263,13 +310,14 @@ def get_recommendations():
                 'action': 'Consider putting extra savings into an emergency fund'
             })
         
-        # Category-specific recommendations
-        high_categories = [(cat, amt) for cat, amt in predictions.items() 
-                          if amt > 0 and cat != 'total']
-        high_categories.sort(key=lambda x: x[1], reverse=True)
+        # Category-specific recommendations (ignoring any 'total' entry)
+        category_amounts = amounts.copy()
+        if 'total' in predictions:
+            category_amounts[categories.index('total')] = 0
         
-        if high_categories:
-            top_category, top_amount = high_categories[0]
+        if category_amounts.size and category_amounts.max() > 0:
+            top_index = int(category_amounts.argmax())
+            top_category, top_amount = categories[top_index], float(category_amounts[top_index])
             pct = (top_amount / total_predicted) * 100
             if pct > 30:
                 recommendations.append({
@@ -286,7 +334,7 @@ def get_recommendations():
                 'action': 'Set up spending alerts for each category'
             })
         
-        return jsonify({
+        return _json_response({
             'recommendations': recommendations,
             'predicted_total': round(total_predicted, 2),
             'budget_difference': round(current_budget - total_predicted, 2),
@@ -295,8 +343,9 @@ def get_recommendations():
     
     except Exception as e:
         logger.error(f"Recommendations error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return _json_response({'error': str(e)}, 500)
 
+# Local development server only; production runs under Gunicorn (see wsgi.py)
 if __name__ == '__main__':
     if model_data is None:
         logger.error("Cannot start server without model. Run train_model.py first!")
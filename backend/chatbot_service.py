@@ -4,6 +4,8 @@ Uses OpenAI API with app-specific system prompt.
 """
 
 import os
+import threading
+from cachetools import TTLCache
 from flask import Blueprint, request, jsonify
 import logging
 
@@ -15,6 +17,22 @@ chatbot_bp = Blueprint('chatbot', __name__)
 # Initialize OpenAI client (lazy load to handle import errors gracefully)
 openai_client = None
 
+# Cache of recent answers to common logged-out questions (TTLCache is not thread-safe)
+CHAT_CACHE_MAX_MESSAGE_LENGTH = 200
+CHAT_CACHE_HISTORY_MESSAGES = 3
+chat_cache = TTLCache(maxsize=1024, ttl=3600)
+chat_cache_lock = threading.Lock()
+
+def _build_http_client():
+    """Pooled HTTP client so OpenAI calls reuse keep-alive connections instead of a TLS handshake each."""
+    import httpx
+    limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
+    try:
+        return httpx.Client(http2=True, limits=limits, timeout=30)
+    except ImportError:
+        # h2 not installed - HTTP/1.1 keep-alive still avoids per-request handshakes
+        return httpx.Client(limits=limits, timeout=30)
+
 def get_openai_client():
     """Lazy load OpenAI client."""
     global openai_client
@@ -25,7 +43,7 @@ def get_openai_client():
             if not api_key:
                 logger.error("OPENAI_API_KEY environment variable not set")
                 return None
-            openai_client = OpenAI(api_key=api_key)
+            openai_client = OpenAI(api_key=api_key, http_client=_build_http_client())
             logger.info("OpenAI client initialized successfully")
         except ImportError:
             logger.error("openai package not installed")
@@ -88,6 +106,9 @@ Splitify is a web app for college students to:
 {context}
 """
 
+# Split the prompt around {context} once so each request is a plain concatenation
+SYSTEM_PROMPT_PREFIX, SYSTEM_PROMPT_SUFFIX = SYSTEM_PROMPT.split('{context}')
+
 WELCOME_MESSAGE = """Hi there! I'm your Splitify assistant. I can help you with:
 
 - Uploading and scanning receipts
@@ -97,6 +118,19 @@ WELCOME_MESSAGE = """Hi there! I'm your Splitify assistant. I can help you with:
 What would you like to do?"""
 
 
+def _chat_cache_key(user_message: str, conversation_history: list, user_context: dict, context_str: str):
+    """
+    Build a cache key from the prompt context, the normalized message and the
+    last few history messages, or return None if the request should not be cached.
+    """
+    if user_context.get('isLoggedIn') or len(user_message) > CHAT_CACHE_MAX_MESSAGE_LENGTH:
+        return None
+    recent_history = tuple(
+        (msg["role"], msg["content"])
+        for msg in conversation_history[-CHAT_CACHE_HISTORY_MESSAGES:]
+    )
+    return (context_str, user_message.strip().lower(), recent_history)
+
 def get_chat_response(user_message: str, conversation_history: list, user_context: dict) -> str:
     """Get chatbot response from OpenAI."""
     
@@ -110,12 +144,21 @@ def get_chat_response(user_message: str, conversation_history: list, user_contex
     - User logged in: {user_context.get('isLoggedIn', False)}
     """
     
+    cache_key = _chat_cache_key(user_message, conversation_history, user_context, context_str)
+    if cache_key is not None:
+        with chat_cache_lock:
+            cached_response = chat_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("Chat response served from cache")
+            return cached_response
+    
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT.format(context=context_str)}
+        {"role": "system", "content": SYSTEM_PROMPT_PREFIX + context_str + SYSTEM_PROMPT_SUFFIX}
     ]
     
     # Add conversation history (last 10 messages for context)
-    for msg in conversation_history[-10:]:
+    for i in range(max(0, len(conversation_history) - 10), len(conversation_history)):
+        msg = conversation_history[i]
         messages.append({"role": msg["role"], "content": msg["content"]})
     
     # Add current user message
@@ -128,7 +171,11 @@ def get_chat_response(user_message: str, conversation_history: list, user_contex
             max_tokens=300,
             temperature=0.7
         )
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if cache_key is not None and content:
+            with chat_cache_lock:
+                chat_cache[cache_key] = content
+        return content
     except Exception as e:
         logger.error(f"OpenAI API error: {e}")
         return "Sorry, I encountered an error. Please try again."
@@ -0,0 +1,116 @@
+"""
+Compact inference copy of a trained gradient-boosted tree ensemble.
+Flattens every tree into shared struct-of-arrays node tables with int16
+feature indices and float32 thresholds/leaf values, and predicts with a
+numba-compiled traversal instead of sklearn's estimator objects.
+"""
+
+import numpy as np
+from numba import njit
+
+# Marker for "no child" in children_left/children_right
+TREE_LEAF = -1
+
+@njit(cache=True)
+def _predict_trees(X, feature, threshold, children_left, children_right, value,
+                   roots, tree_output, baseline):
+    """
+    Add the leaf value each row reaches in every tree to its output's baseline.
+    Runs serially: the API calls this from many server threads at once, so it
+    must not start its own parallel region.
+    """
+    num_rows = X.shape[0]
+    predictions = np.empty((num_rows, baseline.shape[0]))
+    for row in range(num_rows):
+        predictions[row] = baseline
+        for tree in range(roots.shape[0]):
+            node = roots[tree]
+            while children_left[node] != TREE_LEAF:
+                if X[row, feature[node]] <= threshold[node]:
+                    node = children_left[node]
+                else:
+                    node = children_right[node]
+            predictions[row, tree_output[tree]] += value[node]
+    return predictions
+
+class CompactTreeEnsemble:
+    """Quantized struct-of-arrays copy of fitted HistGradientBoostingRegressor models."""
+
+    def __init__(self, feature, threshold, children_left, children_right, value,
+                 roots, tree_output, baseline):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.tree_output = tree_output
+        self.baseline = baseline
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Build from a fitted HistGradientBoostingRegressor, or a
+        MultiOutputRegressor wrapping one booster per output.
+        Inputs are expected to be NaN-free (missing-value routing is not kept).
+        
+        This reads sklearn's private booster internals (_baseline_prediction,
+        _predictors and their node records), so callers should check that the
+        compact copy reproduces the source model's predictions.
+        """
+        boosters = model.estimators_ if hasattr(model, 'estimators_') else [model]
+        features, thresholds, lefts, rights, values = [], [], [], [], []
+        roots, tree_output, baseline = [], [], []
+        offset = 0
+        for output, booster in enumerate(boosters):
+            baseline.append(booster._baseline_prediction.item())
+            for iteration in booster._predictors:
+                nodes = iteration[0].nodes
+                if nodes['is_categorical'].any():
+                    raise ValueError("Categorical splits are not supported by CompactTreeEnsemble")
+                roots.append(offset)
+                tree_output.append(output)
+                features.append(nodes['feature_idx'].astype(np.int16))
+
+                # sklearn compares float64 inputs against float64 thresholds; for float32
+                # inputs, rounding each threshold down to the nearest float32 keeps every
+                # comparison identical
+                threshold = nodes['num_threshold'].astype(np.float32)
+                rounded_up = threshold > nodes['num_threshold']
+                threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+                thresholds.append(threshold)
+
+                # Shift child indices into the concatenated node table
+                is_leaf = nodes['is_leaf'].astype(bool)
+                lefts.append(np.where(is_leaf, TREE_LEAF, nodes['left'].astype(np.int64) + offset).astype(np.int32))
+                rights.append(np.where(is_leaf, TREE_LEAF, nodes['right'].astype(np.int64) + offset).astype(np.int32))
+                values.append(nodes['value'].astype(np.float32))
+                offset += len(nodes)
+
+        return cls(
+            np.concatenate(features),
+            np.concatenate(thresholds),
+            np.concatenate(lefts),
+            np.concatenate(rights),
+            np.concatenate(values),
+            np.array(roots, dtype=np.int32),
+            np.array(tree_output, dtype=np.int16),
+            np.array(baseline, dtype=np.float64)
+        )
+
+    @property
+    def nbytes(self):
+        """Total size of the node tables in bytes."""
+        return sum(array.nbytes for array in (
+            self.feature, self.threshold, self.children_left, self.children_right,
+            self.value, self.roots, self.tree_output, self.baseline
+        ))
+
+    def predict(self, X):
+        """Predict like the source model: (rows, outputs), or (rows,) for one output."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        predictions = _predict_trees(
+            X, self.feature, self.threshold, self.children_left, self.children_right,
+            self.value, self.roots, self.tree_output, self.baseline
+        )
+        return predictions[:, 0] if predictions.shape[1] == 1 else predictions
@@ -6,10 +6,12 @@ Creates realistic monthly expense patterns across various categories.
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from multiprocessing import Pool, cpu_count
 import json
+from numba import njit
 
-# Set random seed for reproducibility
-np.random.seed(42)
+# Base random seed for reproducibility (profiles use this seed, each user's noise a [seed, user_id] stream)
+RANDOM_SEED = 42
 
 # Define expense categories with typical ranges and patterns
 EXPENSE_CATEGORIES = {
@@ -63,111 +65,146 @@ EXPENSE_CATEGORIES = {
     }
 }
 
-def generate_user_profile():
-    """Generate a random user spending profile with income and habits."""
-    income_bracket = np.random.choice(['low', 'medium', 'high'], p=[0.3, 0.5, 0.2])
-    
-    income_multipliers = {
-        'low': np.random.uniform(0.5, 0.8),
-        'medium': np.random.uniform(0.8, 1.3),
-        'high': np.random.uniform(1.3, 2.0)
-    }
-    
-    spending_behavior = np.random.choice(['frugal', 'moderate', 'liberal'], p=[0.25, 0.5, 0.25])
-    behavior_multipliers = {
-        'frugal': np.random.uniform(0.7, 0.9),
-        'moderate': np.random.uniform(0.9, 1.1),
-        'liberal': np.random.uniform(1.1, 1.4)
-    }
-    
-    return {
-        'income_multiplier': income_multipliers[income_bracket],
-        'behavior_multiplier': behavior_multipliers[spending_behavior],
-        'category_preferences': {cat: np.random.uniform(0.7, 1.3) for cat in EXPENSE_CATEGORIES.keys()}
-    }
+# Category parameters as arrays so a user's whole history can be generated at once
+CATEGORY_NAMES = list(EXPENSE_CATEGORIES.keys())
+BASE = np.array([EXPENSE_CATEGORIES[cat]['base'] for cat in CATEGORY_NAMES], dtype=np.float64)
+STD = np.array([EXPENSE_CATEGORIES[cat]['std'] for cat in CATEGORY_NAMES], dtype=np.float64)
+TREND = np.array([EXPENSE_CATEGORIES[cat]['trend'] for cat in CATEGORY_NAMES], dtype=np.float64)
+SEASONALITY = np.array([EXPENSE_CATEGORIES[cat]['seasonality'] for cat in CATEGORY_NAMES], dtype=np.float64).T  # (12, categories)
 
-def generate_monthly_expense(category, month_index, base_amount, user_profile, previous_expenses):
-    """Generate expense for a specific category and month."""
-    config = EXPENSE_CATEGORIES[category]
+# One row of the generated dataset
+RECORD_DTYPE = np.dtype(
+    [('user_id', 'i8'), ('month', 'U7'), ('month_index', 'i8')]
+    + [(cat, 'f8') for cat in CATEGORY_NAMES]
+    + [('total', 'f8')]
+)
+
+# Income brackets (low, medium, high) and spending behaviors (frugal, moderate, liberal):
+# probability of each and the (low, high) range of its multiplier
+INCOME_BRACKET_PROBS = [0.3, 0.5, 0.2]
+INCOME_MULTIPLIER_RANGES = np.array([[0.5, 0.8], [0.8, 1.3], [1.3, 2.0]])
+BEHAVIOR_PROBS = [0.25, 0.5, 0.25]
+BEHAVIOR_MULTIPLIER_RANGES = np.array([[0.7, 0.9], [0.9, 1.1], [1.1, 1.4]])
+
+def generate_user_profiles(num_users, rng):
+    """
+    Generate random spending profiles (income and habits) for many users at once.
     
-    # Apply user profile multipliers
-    adjusted_base = base_amount * user_profile['income_multiplier'] * user_profile['behavior_multiplier']
-    adjusted_base *= user_profile['category_preferences'][category]
+    Returns:
+        Tuple of income multipliers (num_users,), behavior multipliers
+        (num_users,) and category preferences (num_users, categories)
+    """
+    income_brackets = rng.choice(len(INCOME_BRACKET_PROBS), size=num_users, p=INCOME_BRACKET_PROBS)
+    income_ranges = INCOME_MULTIPLIER_RANGES[income_brackets]
+    income_multipliers = rng.uniform(income_ranges[:, 0], income_ranges[:, 1])
     
-    # Apply trend (cumulative over months)
-    trend_factor = (1 + config['trend']) ** month_index
+    spending_behaviors = rng.choice(len(BEHAVIOR_PROBS), size=num_users, p=BEHAVIOR_PROBS)
+    behavior_ranges = BEHAVIOR_MULTIPLIER_RANGES[spending_behaviors]
+    behavior_multipliers = rng.uniform(behavior_ranges[:, 0], behavior_ranges[:, 1])
     
-    # Apply seasonality
-    seasonal_factor = config['seasonality'][month_index % 12]
+    category_preferences = rng.uniform(0.7, 1.3, (num_users, len(CATEGORY_NAMES)))
     
-    # Add momentum from previous months (spending habits)
-    momentum = 0
-    if len(previous_expenses) > 0:
-        recent_avg = np.mean(previous_expenses[-3:]) if len(previous_expenses) >= 3 else np.mean(previous_expenses)
-        momentum = (recent_avg - adjusted_base) * 0.3  # 30% momentum from recent spending
+    return income_multipliers, behavior_multipliers, category_preferences
+
+@njit(cache=True)
+def _apply_momentum(expected, noise, adjusted_base):
+    """
+    Add momentum from previous months (spending habits) and noise to the
+    expected (months, categories) expenses. Each month depends on the
+    previous three, so this is a serial recurrence compiled with numba.
+    """
+    num_months, num_categories = expected.shape
+    expenses = np.empty_like(expected)
+    for month_idx in range(num_months):
+        start = max(0, month_idx - 3)
+        for cat_idx in range(num_categories):
+            momentum = 0.0
+            if month_idx > 0:
+                recent_total = 0.0
+                for prev_idx in range(start, month_idx):
+                    recent_total += expenses[prev_idx, cat_idx]
+                recent_avg = recent_total / (month_idx - start)
+                momentum = (recent_avg - adjusted_base[cat_idx]) * 0.3  # 30% momentum from recent spending
+            
+            # Ensure non-negative
+            expense = max(0.0, expected[month_idx, cat_idx] + momentum + noise[month_idx, cat_idx])
+            expenses[month_idx, cat_idx] = np.round(expense, 2)
+    return expenses
+
+def generate_user_data(user_id, income_multiplier, behavior_multiplier, category_preferences,
+                       num_months=24, rng=None):
+    """Generate one user's expense history as a (num_months, categories) array."""
+    if rng is None:
+        rng = np.random.default_rng([RANDOM_SEED, user_id])
     
-    # Calculate base expense
-    expected = adjusted_base * trend_factor * seasonal_factor + momentum
+    # Apply user profile multipliers to every category at once
+    adjusted_base = BASE * income_multiplier * behavior_multiplier
+    adjusted_base *= category_preferences
     
-    # Add random noise
-    noise = np.random.normal(0, config['std'] * user_profile['behavior_multiplier'])
+    # Trend (cumulative over months) and seasonality as (num_months, categories) arrays
+    month_indices = np.arange(num_months)
+    trend_factor = (1 + TREND) ** month_indices[:, None]
+    seasonal_factor = SEASONALITY[month_indices % 12]
+    expected = adjusted_base * trend_factor * seasonal_factor
     
-    # Ensure non-negative
-    expense = max(0, expected + noise)
+    # Random noise for every month and category
+    noise = rng.normal(0, STD * behavior_multiplier, (num_months, len(CATEGORY_NAMES)))
     
-    return round(expense, 2)
+    # Momentum from previous months is the only serial dependency
+    return _apply_momentum(expected, noise, adjusted_base)
 
-def generate_user_data(user_id, num_months=24):
-    """Generate complete expense history for one user."""
-    user_profile = generate_user_profile()
-    user_data = []
-    
-    # Track previous expenses for momentum calculation
-    category_history = {cat: [] for cat in EXPENSE_CATEGORIES.keys()}
-    
+def _generate_user_worker(args):
+    """Pool worker: generate one user's history from its own seeded RNG."""
+    user_id, months_per_user, seed, income_multiplier, behavior_multiplier, category_preferences = args
+    rng = np.random.default_rng([seed, user_id])
+    expenses = generate_user_data(
+        user_id, income_multiplier, behavior_multiplier, category_preferences, months_per_user, rng
+    )
+    return user_id, expenses
+
+def generate_month_strings(num_months):
+    """Calendar month ('YYYY-MM') for each month index, ending at the current month."""
     start_date = datetime.now() - timedelta(days=30 * num_months)
-    
-    for month_idx in range(num_months):
-        month_date = start_date + timedelta(days=30 * month_idx)
-        month_str = month_date.strftime('%Y-%m')
-        
-        month_expenses = {}
-        for category, config in EXPENSE_CATEGORIES.items():
-            expense = generate_monthly_expense(
-                category,
-                month_idx,
-                config['base'],
-                user_profile,
-                category_history[category]
-            )
-            month_expenses[category] = expense
-            category_history[category].append(expense)
-        
-        # Add some derived features
-        total_expense = sum(month_expenses.values())
-        
-        user_data.append({
-            'user_id': user_id,
-            'month': month_str,
-            'month_index': month_idx,
-            **month_expenses,
-            'total': round(total_expense, 2)
-        })
-    
-    return user_data
+    return [
+        (start_date + timedelta(days=30 * month_idx)).strftime('%Y-%m')
+        for month_idx in range(num_months)
+    ]
 
-def generate_dataset(num_users=1000, months_per_user=24):
+def generate_dataset(num_users=1000, months_per_user=24, seed=RANDOM_SEED):
     """Generate complete dataset with multiple users."""
     print(f"Generating data for {num_users} users over {months_per_user} months each...")
     
-    all_data = []
-    for user_id in range(num_users):
-        if (user_id + 1) % 100 == 0:
-            print(f"Generated data for {user_id + 1} users...")
-        user_data = generate_user_data(user_id, months_per_user)
-        all_data.extend(user_data)
+    # Preallocate one record per (user, month) and fill each user's block in place
+    records = np.empty(num_users * months_per_user, dtype=RECORD_DTYPE)
+    month_strings = generate_month_strings(months_per_user)
+    month_indices = np.arange(months_per_user)
+    
+    # Sample every user's profile up front, then generate users in parallel across processes
+    income_multipliers, behavior_multipliers, category_preferences = generate_user_profiles(
+        num_users, np.random.default_rng(seed)
+    )
+    tasks = [
+        (user_id, months_per_user, seed,
+         income_multipliers[user_id], behavior_multipliers[user_id], category_preferences[user_id])
+        for user_id in range(num_users)
+    ]
+    completed = 0
+    with Pool(cpu_count()) as pool:
+        for user_id, expenses in pool.imap_unordered(_generate_user_worker, tasks, chunksize=25):
+            # Workers finish out of order; each user's rows live at a fixed offset
+            block = records[user_id * months_per_user:(user_id + 1) * months_per_user]
+            block['user_id'] = user_id
+            block['month'] = month_strings
+            block['month_index'] = month_indices
+            for cat_idx, category in enumerate(CATEGORY_NAMES):
+                block[category] = expenses[:, cat_idx]
+            block['total'] = np.round(expenses.sum(axis=1), 2)
+            
+            completed += 1
+            if completed % 100 == 0:
+                print(f"Generated data for {completed} users...")
     
-    df = pd.DataFrame(all_data)
+    df = pd.DataFrame.from_records(records)
     print(f"\nGenerated {len(df)} records")
     print(f"Date range: {df['month'].min()} to {df['month'].max()}")
     print(f"\nSample statistics:")
@@ -177,31 +214,51 @@ def generate_dataset(num_users=1000, months_per_user=24):
 
 def create_features(df):
     """Create additional features for model training."""
-    df_features = df.copy()
+    # Sort by user and month once to ensure correct ordering (generate_dataset already emits it sorted)
+    user_ids = df['user_id'].to_numpy()
+    month_indices = df['month_index'].to_numpy()
+    is_sorted = np.all(
+        (user_ids[1:] > user_ids[:-1])
+        | ((user_ids[1:] == user_ids[:-1]) & (month_indices[1:] >= month_indices[:-1]))
+    )
+    df_features = df.copy() if is_sorted else df.sort_values(['user_id', 'month_index'])
     
     # Time-based features
-    df_features['year'] = pd.to_datetime(df_features['month']).dt.year
-    df_features['month_num'] = pd.to_datetime(df_features['month']).dt.month
+    month_dates = pd.to_datetime(df_features['month'])
+    df_features['year'] = month_dates.dt.year
+    df_features['month_num'] = month_dates.dt.month
     
-    # Lag features (previous months' expenses)
+    # Every user has the same number of contiguous months, so the category
+    # columns form a dense (users, months, categories) tensor
     category_cols = list(EXPENSE_CATEGORIES.keys())
+    num_users = df_features['user_id'].nunique()
+    num_months = len(df_features) // num_users
+    if num_users * num_months != len(df_features) or (df_features.groupby('user_id').size() != num_months).any():
+        raise ValueError("create_features expects the same number of months for every user")
+    values = df_features[category_cols].to_numpy(dtype=np.float64).reshape(num_users, num_months, len(category_cols))
+    
+    # Lag features (previous months' expenses, 0 for the first few months)
+    lags = []
+    for lag in [1, 2, 3]:
+        lagged = np.zeros_like(values)
+        lagged[:, lag:, :] = values[:, :-lag, :]
+        lags.append(lagged)
+    
+    # Rolling averages over the current and previous two months
+    window_sizes = np.minimum(np.arange(1, num_months + 1), 3)[None, :, None]
+    rolling_avg_3 = (values + lags[0] + lags[1]) / window_sizes
     
-    for category in category_cols:
-        # Sort by user and month to ensure correct ordering
-        df_features = df_features.sort_values(['user_id', 'month_index'])
-        
-        # Create lag features (1, 2, 3 months back)
-        for lag in [1, 2, 3]:
-            df_features[f'{category}_lag{lag}'] = df_features.groupby('user_id')[category].shift(lag)
-        
-        # Rolling averages
-        df_features[f'{category}_rolling_avg_3'] = df_features.groupby('user_id')[category].transform(
-            lambda x: x.rolling(window=3, min_periods=1).mean()
-        )
-    
-    # Fill NaN values in lag features with 0 (for first few months)
-    lag_cols = [col for col in df_features.columns if 'lag' in col or 'rolling' in col]
-    df_features[lag_cols] = df_features[lag_cols].fillna(0)
+    # Stack as (rows, categories, [lag1, lag2, lag3, rolling_avg_3]) to keep per-category column order
+    features = np.stack(lags + [rolling_avg_3], axis=-1).reshape(len(df_features), -1)
+    feature_cols = [
+        f'{category}_{suffix}'
+        for category in category_cols
+        for suffix in ['lag1', 'lag2', 'lag3', 'rolling_avg_3']
+    ]
+    df_features = pd.concat(
+        [df_features, pd.DataFrame(features, columns=feature_cols, index=df_features.index)],
+        axis=1
+    )
     
     return df_features
 
@@ -217,10 +274,13 @@ if __name__ == "__main__":
     print("\nCreating features...")
     df_features = create_features(df)
     
-    # Save data
+    # Save data (amounts and features as float32: half the size on disk and in
+    # memory, and the model casts its inputs to float32 anyway)
     print("\nSaving data...")
-    df_features.to_csv('expense_training_data.csv', index=False)
-    print("Saved to: expense_training_data.csv")
+    float_cols = df_features.select_dtypes('float64').columns
+    df_features = df_features.astype(dict.fromkeys(float_cols, 'float32'))
+    df_features.to_parquet('expense_training_data.parquet', engine='pyarrow', compression='zstd', index=False)
+    print("Saved to: expense_training_data.parquet")
     
     # Save metadata
     metadata = {
@@ -61,7 +61,7 @@ Estimated time: 3-5 minutes
     
     required_packages = [
         'flask', 'flask_cors', 'pandas', 'numpy', 
-        'sklearn', 'matplotlib'
+        'sklearn', 'matplotlib', 'pyarrow', 'orjson'
     ]
     
     missing_packages = []
@@ -90,7 +90,7 @@ Estimated time: 3-5 minutes
     # Step 2: Generate training data
     print_header("STEP 2: Generating Training Data")
     
-    if check_file_exists('expense_training_data.csv'):
+    if check_file_exists('expense_training_data.parquet'):
         print("⚠ Training data already exists.")
         response = input("Regenerate? (y/n): ")
         if response.lower() != 'y':
@@ -115,7 +115,7 @@ Estimated time: 3-5 minutes
     # Step 3: Train models
     print_header("STEP 3: Training ML Models")
     
-    if check_file_exists('expense_predictor_model.pkl'):
+    if check_file_exists('expense_predictor_model.joblib'):
         print("⚠ Trained model already exists.")
         response = input("Retrain? (y/n): ")
         if response.lower() != 'y':
@@ -176,8 +176,8 @@ Estimated time: 3-5 minutes
    See README_SETUP.md for detailed information
 
 📊 FILES CREATED:
-   - expense_training_data.csv (training data)
-   - expense_predictor_model.pkl (trained models)
+   - expense_training_data.parquet (training data)
+   - expense_predictor_model.joblib (trained models)
    - training_results.json (performance metrics)
    - prediction_examples.png (visualizations)
 
@@ -4,9 +4,10 @@ Run this after training the model to ensure everything works.
 """
 
 import json
-import pickle
+import orjson
 import pandas as pd
 import numpy as np
+from train_model import ExpensePredictor
 
 def test_model_loading():
     """Test that model loads correctly."""
@@ -15,31 +16,31 @@ def test_model_loading():
     print("="*60)
     
     try:
-        with open('expense_predictor_model.pkl', 'rb') as f:
-            model_data = pickle.load(f)
+        predictor = ExpensePredictor.load('expense_predictor_model.joblib')
         
         print("✓ Model loaded successfully")
-        print(f"✓ Found {len(model_data['models'])} category models")
-        print(f"✓ Feature columns: {len(model_data['feature_columns'])}")
+        print(f"✓ Found multi-output model for {len(predictor.categories)} categories")
+        print(f"✓ Feature columns: {len(predictor.feature_columns)}")
         
-        categories = model_data['categories']
+        categories = predictor.categories
         print(f"✓ Categories: {', '.join(categories)}")
         
-        return True, model_data
+        return True, predictor
     except Exception as e:
         print(f"✗ Error loading model: {e}")
         return False, None
 
-def test_prediction():
-    """Test prediction with sample data."""
+def test_prediction(predictor):
+    """Test prediction with sample data, using the model loaded by test_model_loading."""
     print("\n" + "="*60)
     print("TEST 2: Prediction Functionality")
     print("="*60)
     
+    if predictor is None:
+        print("\n✗ Model not loaded, skipping prediction")
+        return False
+    
     try:
-        with open('expense_predictor_model.pkl', 'rb') as f:
-            model_data = pickle.load(f)
-        
         # Create sample history (4 months)
         sample_history = pd.DataFrame([
             {
@@ -89,33 +90,14 @@ def test_prediction():
         ])
         
         print("\nSample history (last 3 months):")
-        print(sample_history.tail(3)[model_data['categories']].to_string())
-        
-        # Prepare features
-        last_3_months = sample_history.tail(3)
-        features = {}
-        
-        # Next month number
-        last_month_date = pd.to_datetime(sample_history['month'].iloc[-1])
-        next_month_num = (last_month_date.month % 12) + 1
-        features['month_num'] = next_month_num
-        
-        # Lag features
-        for category in model_data['categories']:
-            values = last_3_months[category].values
-            features[f'{category}_lag1'] = float(values[-1])
-            features[f'{category}_lag2'] = float(values[-2])
-            features[f'{category}_lag3'] = float(values[-3])
-            features[f'{category}_rolling_avg_3'] = float(np.mean(values))
+        print(sample_history.tail(3)[predictor.categories].to_string())
         
-        X = pd.DataFrame([features])[model_data['feature_columns']]
+        # Build the feature row the same way predict_next_month does
+        X = predictor._make_features(sample_history)
         
-        # Make predictions
-        predictions = {}
-        for category in model_data['categories']:
-            X_scaled = model_data['scalers'][category].transform(X)
-            pred = model_data['models'][category].predict(X_scaled)[0]
-            predictions[category] = max(0, round(float(pred), 2))
+        # Make predictions (one call covers every category)
+        preds = np.maximum(predictor.model.predict(X)[0], 0.0).round(2)
+        predictions = dict(zip(predictor.categories, preds.tolist()))
         
         print("\nPredictions for next month:")
         total = 0
@@ -139,8 +121,8 @@ def test_training_results():
     print("="*60)
     
     try:
-        with open('training_results.json', 'r') as f:
-            results = json.load(f)
+        with open('training_results.json', 'rb') as f:
+            results = orjson.loads(f.read())
         
         print("\nModel Performance (Test Set):")
         print(f"{'Category':18} {'MAE':>10} {'R²':>10}")
@@ -177,7 +159,7 @@ def test_data_generation():
     print("="*60)
     
     try:
-        df = pd.read_csv('expense_training_data.csv')
+        df = pd.read_parquet('expense_training_data.parquet')
         
         print(f"\n✓ Training data loaded: {len(df)} records")
         print(f"✓ Users: {df['user_id'].nunique()}")
@@ -257,11 +239,15 @@ def run_all_tests():
         ("API Format", test_api_format)
     ]
     
+    # The model is loaded once by the loading test and reused by the prediction test
+    predictor = None
     results = []
     for name, test_func in tests:
         try:
             if name == "Model Loading":
-                success, _ = test_func()
+                success, predictor = test_func()
+            elif name == "Prediction":
+                success = test_func(predictor)
             else:
                 success = test_func()
             results.append((name, success))
@@ -1,17 +1,15 @@
 """
 Train ML model to predict next month's expenses by category.
-Uses Random Forest with feature engineering for time series prediction.
+Uses histogram gradient boosting with feature engineering for time series prediction.
 """
 
 import numpy as np
 import pandas as pd
-import pickle
-import json
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import matplotlib.pyplot as plt
+import joblib
+import orjson
+import os
+from numba import njit
+from compact_trees import CompactTreeEnsemble
 
 EXPENSE_CATEGORIES = [
     'Groceries', 'Transportation', 'Entertainment', 'Dining Out',
@@ -22,13 +20,14 @@ class ExpensePredictor:
     """ML model to predict next month's expenses."""
     
     def __init__(self):
-        self.models = {}
-        self.scalers = {}
+        self.model = None
         self.feature_columns = None
+        self._feat_index = None
+        self._category_feature_index = None
         self.categories = EXPENSE_CATEGORIES
         
     def prepare_features(self, df, is_training=True):
-        """Prepare feature matrix for training or prediction."""
+        """Prepare the float32 feature matrix for training or prediction."""
         feature_cols = []
         
         # Month number (1-12 for seasonality)
@@ -44,13 +43,33 @@ class ExpensePredictor:
             ])
         
         if is_training:
-            self.feature_columns = feature_cols
+            self._set_feature_columns(feature_cols)
         
-        X = df[feature_cols].copy()
+        # C-contiguous float32, the same dtype the model sees at inference time
+        X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float32))
         return X
     
+    def _set_feature_columns(self, feature_columns):
+        """
+        Record the training feature order and each feature's column position,
+        including the (categories, 4) positions of every category's
+        [lag1, lag2, lag3, rolling_avg_3] so predictions only index with them.
+        """
+        self.feature_columns = feature_columns
+        self._feat_index = {name: i for i, name in enumerate(feature_columns)}
+        self._category_feature_index = np.array([
+            [self._feat_index[f'{category}_{suffix}'] for suffix in ['lag1', 'lag2', 'lag3', 'rolling_avg_3']]
+            for category in self.categories
+        ])
+    
     def train(self, df, test_size=0.2):
-        """Train separate models for each expense category."""
+        """Train one multi-output model covering every expense category."""
+        # Imported here so loading a saved model for inference doesn't pull in sklearn
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        from sklearn.multioutput import MultiOutputRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error, r2_score
+        
         print("\n" + "=" * 60)
         print("TRAINING EXPENSE PREDICTION MODELS")
         print("=" * 60)
@@ -61,75 +80,74 @@ class ExpensePredictor:
         print(f"\nTraining on {len(df_train)} records")
         print(f"Features: {len(self.categories) * 4 + 1}")
         
-        # Prepare features
+        # Prepare features and the (records, categories) target matrix
         X = self.prepare_features(df_train, is_training=True)
+        y = df_train[self.categories].to_numpy(dtype=np.float32)
+        
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=test_size, random_state=42
+        )
+        
+        # HistGradientBoosting bins each feature once and splits on histograms, but
+        # only fits a single target, so train one booster per category, each in
+        # its own joblib worker (joblib caps each worker's OpenMP threads to avoid
+        # oversubscription). Trees are invariant to feature scaling, so no scaler is needed.
+        print("\n--- Training gradient-boosted models for all categories ---")
+        model = MultiOutputRegressor(HistGradientBoostingRegressor(
+            max_iter=200,
+            max_depth=8,
+            learning_rate=0.05,
+            early_stopping=True,
+            validation_fraction=0.1,
+            random_state=42
+        ), n_jobs=min(len(self.categories), os.cpu_count() or 1))
+        
+        model.fit(X_train, y_train)
+        
+        # Evaluate (one metric value per category)
+        y_pred_train = model.predict(X_train)
+        y_pred_test = model.predict(X_test)
+        
+        train_mae = mean_absolute_error(y_train, y_pred_train, multioutput='raw_values')
+        test_mae = mean_absolute_error(y_test, y_pred_test, multioutput='raw_values')
+        train_r2 = r2_score(y_train, y_pred_train, multioutput='raw_values')
+        test_r2 = r2_score(y_test, y_pred_test, multioutput='raw_values')
+        
+        # Keep only the quantized node tables for inference
+        self.model = CompactTreeEnsemble.from_sklearn(model)
+        print(f"Compacted trees to {self.model.nbytes / 1e6:.1f} MB of node tables")
+        
+        # The compact copy is built from sklearn internals; make sure it still
+        # reproduces the trained model before it replaces it
+        if not np.allclose(self.model.predict(X_test), y_pred_test, atol=1e-3):
+            raise RuntimeError("Compacted trees do not reproduce the trained model's predictions")
         
         results = {}
         
-        for category in self.categories:
-            print(f"\n--- Training model for {category} ---")
-            
-            y = df_train[category].values
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=test_size, random_state=42
-            )
-            
-            # Scale features
-            scaler = StandardScaler()
-            X_train_scaled = scaler.fit_transform(X_train)
-            X_test_scaled = scaler.transform(X_test)
-            
-            # Train model
-            model = RandomForestRegressor(
-                n_estimators=100,
-                max_depth=15,
-                min_samples_split=10,
-                min_samples_leaf=5,
-                random_state=42,
-                n_jobs=-1
-            )
-            
-            model.fit(X_train_scaled, y_train)
-            
-            # Evaluate
-            y_pred_train = model.predict(X_train_scaled)
-            y_pred_test = model.predict(X_test_scaled)
-            
-            train_mae = mean_absolute_error(y_train, y_pred_train)
-            test_mae = mean_absolute_error(y_test, y_pred_test)
-            train_r2 = r2_score(y_train, y_pred_train)
-            test_r2 = r2_score(y_test, y_pred_test)
-            
-            print(f"Train MAE: ${train_mae:.2f}")
-            print(f"Test MAE:  ${test_mae:.2f}")
-            print(f"Train R²:  {train_r2:.4f}")
-            print(f"Test R²:   {test_r2:.4f}")
-            
-            # Store model and scaler
-            self.models[category] = model
-            self.scalers[category] = scaler
+        for i, category in enumerate(self.categories):
+            print(f"\n--- {category} ---")
+            print(f"Train MAE: ${train_mae[i]:.2f}")
+            print(f"Test MAE:  ${test_mae[i]:.2f}")
+            print(f"Train R²:  {train_r2[i]:.4f}")
+            print(f"Test R²:   {test_r2[i]:.4f}")
             
             results[category] = {
-                'train_mae': float(train_mae),
-                'test_mae': float(test_mae),
-                'train_r2': float(train_r2),
-                'test_r2': float(test_r2)
+                'train_mae': float(train_mae[i]),
+                'test_mae': float(test_mae[i]),
+                'train_r2': float(train_r2[i]),
+                'test_r2': float(test_r2[i])
             }
         
         return results
     
-    def predict_next_month(self, user_history):
+    def _make_features(self, user_history):
         """
-        Predict next month's expenses given user's history.
+        Build the (1, features) float32 row predicting the month after user_history.
         
         Args:
             user_history: DataFrame with columns for each category and 'month'
                          Must contain at least 3 months of data
-        
-        Returns:
-            Dictionary with predicted expenses for each category
         """
         if len(user_history) < 3:
             raise ValueError("Need at least 3 months of history for prediction")
@@ -140,89 +158,135 @@ class ExpensePredictor:
         # Get the last 3 months for lag features
         last_3_months = user_history.tail(3)
         
-        # Create feature row
-        features = {}
+        # Last 3 months as a (3, categories) array; categories missing from history are 0
+        values = last_3_months.reindex(columns=self.categories, fill_value=0).to_numpy(dtype=np.float64)
         
         # Next month number (cyclical)
-        last_month_date = pd.to_datetime(user_history['month'].iloc[-1])
-        next_month_num = (last_month_date.month % 12) + 1
-        features['month_num'] = next_month_num
+        # Months are canonical 'YYYY-MM' strings, so read the month digits directly
+        month_str = user_history['month'].iat[-1]
+        next_month_num = (int(month_str[5:7]) % 12) + 1
         
-        # Create lag features from history
-        for category in self.categories:
-            if category in user_history.columns:
-                values = last_3_months[category].values
-                features[f'{category}_lag1'] = values[-1] if len(values) >= 1 else 0
-                features[f'{category}_lag2'] = values[-2] if len(values) >= 2 else 0
-                features[f'{category}_lag3'] = values[-3] if len(values) >= 3 else 0
-                features[f'{category}_rolling_avg_3'] = np.mean(values)
-            else:
-                # Category not present in history, use 0
-                features[f'{category}_lag1'] = 0
-                features[f'{category}_lag2'] = 0
-                features[f'{category}_lag3'] = 0
-                features[f'{category}_rolling_avg_3'] = 0
-        
-        # Create feature DataFrame
-        X = pd.DataFrame([features])[self.feature_columns]
-        
-        # Predict for each category
-        predictions = {}
-        for category in self.categories:
-            X_scaled = self.scalers[category].transform(X)
-            pred = self.models[category].predict(X_scaled)[0]
-            predictions[category] = max(0, round(pred, 2))  # Ensure non-negative
+        # Per-category [lag1, lag2, lag3, rolling_avg_3], placed into the feature
+        # row by name so any training column order works
+        category_features = np.empty((len(self.categories), 4))
+        category_features[:, :3] = values[::-1].T
+        category_features[:, 3] = values.mean(axis=0)
+        X = np.empty((1, len(self.feature_columns)), dtype=np.float32)
+        X[0, self._feat_index['month_num']] = next_month_num
+        X[0, self._category_feature_index] = category_features
+        
+        return X
+    
+    def predict_next_month(self, user_history):
+        """
+        Predict next month's expenses given user's history.
+        
+        Args:
+            user_history: DataFrame with columns for each category and 'month'
+                         Must contain at least 3 months of data
+        
+        Returns:
+            Dictionary with predicted expenses for each category
+        """
+        X = self._make_features(user_history)
+        
+        # Predict every category in one call, clamped non-negative and rounded to cents
+        preds = np.maximum(self.model.predict(X)[0], 0.0).round(2)
+        predictions = dict(zip(self.categories, preds.tolist()))
         
         predictions['total'] = round(sum(predictions.values()), 2)
         
         return predictions
     
-    def save(self, filepath='expense_predictor_model.pkl'):
-        """Save trained model to disk."""
+    def save(self, filepath='expense_predictor_model.joblib'):
+        """
+        Save trained model to disk.
+        
+        Stored uncompressed: joblib writes the NumPy node arrays as raw
+        contiguous blocks, which load() can memory-map (compressed joblib
+        files cannot be memory-mapped).
+        """
         model_data = {
-            'models': self.models,
-            'scalers': self.scalers,
+            'model': self.model,
             'feature_columns': self.feature_columns,
             'categories': self.categories
         }
-        with open(filepath, 'wb') as f:
-            pickle.dump(model_data, f)
+        joblib.dump(model_data, filepath, compress=0)
         print(f"\nModel saved to: {filepath}")
     
     @classmethod
-    def load(cls, filepath='expense_predictor_model.pkl'):
+    def load(cls, filepath='expense_predictor_model.joblib'):
         """Load trained model from disk."""
         predictor = cls()
-        with open(filepath, 'rb') as f:
-            model_data = pickle.load(f)
-        predictor.models = model_data['models']
-        predictor.scalers = model_data['scalers']
-        predictor.feature_columns = model_data['feature_columns']
+        model_data = joblib.load(filepath, mmap_mode='r')
+        predictor.model = model_data['model']
+        # Categories first: the feature index is built per category
         predictor.categories = model_data['categories']
+        predictor._set_feature_columns(model_data['feature_columns'])
         return predictor
 
+@njit(cache=True)
+def _build_rollout_features(values, out):
+    """
+    Fill per-category [lag1, lag2, lag3, rolling_avg_3] features for every
+    month of one user's (months, categories) history.
+    Lags are the previous three months, as in predict_next_month, so rows
+    for the first three months are left untouched.
+    """
+    num_months, num_categories = values.shape
+    for month in range(3, num_months):
+        for category in range(num_categories):
+            lag1 = values[month - 1, category]
+            lag2 = values[month - 2, category]
+            lag3 = values[month - 3, category]
+            out[month, 4 * category] = lag1
+            out[month, 4 * category + 1] = lag2
+            out[month, 4 * category + 2] = lag3
+            out[month, 4 * category + 3] = (lag1 + lag2 + lag3) / 3
+
 def plot_predictions(df, predictor, user_ids=[0, 1, 2]):
     """Plot predictions vs actuals for sample users."""
+    import matplotlib.pyplot as plt
+    
     fig, axes = plt.subplots(len(user_ids), 1, figsize=(12, 4 * len(user_ids)))
     if len(user_ids) == 1:
         axes = [axes]
     
-    for idx, user_id in enumerate(user_ids):
+    columns = ['month_num'] + [
+        f'{category}_{suffix}'
+        for category in predictor.categories
+        for suffix in ['lag1', 'lag2', 'lag3', 'rolling_avg_3']
+    ]
+    feature_order = [columns.index(column) for column in predictor.feature_columns]
+    
+    # Build each user's rollout features: the row for month i uses months
+    # i-1..i-3 as lags, exactly as predict_next_month(history[:i]) would.
+    # Users may have different history lengths (or none at all).
+    user_features, user_months, user_totals = [], [], []
+    for user_id in user_ids:
         user_data = df[df['user_id'] == user_id].sort_values('month_index')
+        X = np.zeros((len(user_data), len(columns)), dtype=np.float32)
+        X[:, 0] = pd.to_datetime(user_data['month']).dt.month
+        _build_rollout_features(user_data[predictor.categories].to_numpy(dtype=np.float64), X[:, 1:])
         
         # Use first N months to predict N+1
-        predictions = []
-        actuals = []
-        months = []
-        
-        for i in range(3, len(user_data)):
-            history = user_data.iloc[:i]
-            pred = predictor.predict_next_month(history)
-            actual = user_data.iloc[i]['total']
-            
-            predictions.append(pred['total'])
-            actuals.append(actual)
-            months.append(user_data.iloc[i]['month'])
+        user_features.append(X[3:, feature_order])
+        user_months.append(user_data['month'].to_numpy()[3:])
+        user_totals.append(user_data['total'].to_numpy()[3:])
+    
+    # One predict call covers every plotted user
+    X_all = np.concatenate(user_features)
+    if len(X_all):
+        preds = predictor.model.predict(X_all).reshape(len(X_all), -1)
+        predicted_totals = np.maximum(np.round(preds, 2), 0).sum(axis=1).round(2)
+    else:
+        predicted_totals = np.empty(0)
+    user_predictions = np.split(predicted_totals, np.cumsum([len(X) for X in user_features])[:-1])
+    
+    for idx, user_id in enumerate(user_ids):
+        predictions = user_predictions[idx]
+        actuals = user_totals[idx]
+        months = user_months[idx]
         
         axes[idx].plot(months, actuals, label='Actual', marker='o')
         axes[idx].plot(months, predictions, label='Predicted', marker='s', linestyle='--')
@@ -240,7 +304,7 @@ def plot_predictions(df, predictor, user_ids=[0, 1, 2]):
 if __name__ == "__main__":
     # Load training data
     print("\nLoading training data...")
-    df = pd.read_csv('expense_training_data.csv')
+    df = pd.read_parquet('expense_training_data.parquet')
     print(f"Loaded {len(df)} records")
     
     # Initialize and train predictor
@@ -257,11 +321,11 @@ if __name__ == "__main__":
         print(f"  Test R²:  {metrics['test_r2']:.4f}")
     
     # Save model
-    predictor.save('expense_predictor_model.pkl')
+    predictor.save('expense_predictor_model.joblib')
     
     # Save results as JSON
-    with open('training_results.json', 'w') as f:
-        json.dump(results, f, indent=2)
+    with open('training_results.json', 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     print("\nTraining results saved to: training_results.json")
     
     # Test prediction on sample user
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for running the API server under Gunicorn.
+
+    gunicorn --bind 0.0.0.0:5001 --workers 4 --threads 8 --worker-class gthread --preload wsgi:app
+
+--preload imports api_server (and loads the model) once in the master
+process before forking, so workers share the model pages instead of each
+unpickling their own copy. gthread workers let each process serve several
+requests concurrently while others wait on I/O (e.g. the chatbot).
+"""
+
+from api_server import app